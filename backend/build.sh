@@ -3,5 +3,8 @@
 python3 -m pip install --upgrade pip
 pip install -r requirements.txt
 
+# Export the int8 ONNX encoder (search and indexing fall back to PyTorch fp32 without it)
+(cd data-extraction && python3 onnx_encoder.py) || echo "ONNX export failed; using the PyTorch encoder"
+
 # Install Node.js dependencies
 npm install
\ No newline at end of file
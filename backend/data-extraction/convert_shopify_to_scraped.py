@@ -1,6 +1,12 @@
-import json, os, re
-from html import unescape
-from typing import Tuple, List, Dict, Any
+import os, re
+from itertools import chain, islice
+from multiprocessing import Pool
+from typing import Tuple, List, Dict, Any, Iterable, Iterator, Optional
+import ahocorasick
+import ijson
+import numpy as np
+import orjson
+from selectolax.parser import HTMLParser
 
 # Paths resolved relative to this file for robustness
 CUR = os.path.dirname(os.path.abspath(__file__))
@@ -11,13 +17,47 @@ OUT = os.path.normpath(os.path.join(ROOT,'data-extraction',  'data', 'scraped_da
 # Change base to the real storefront if needed; keep trailing slash
 PRODUCT_BASE_URL = 'https://b2b-demo-store.myshopify.com/products/'
 
+_WS_RE = re.compile(r'\s+')
+_HANDLE_RE = re.compile(r'[^a-z0-9-]+')
+POOL_MIN_PRODUCTS = 1000  # same serial cut-off as indexer.POOL_MIN_PAGES
+
 def html_to_text(html: str) -> str:
     """Lightweight HTML to text cleanup."""
-    html = html or ''
-    text = re.sub(r'<[^>]+>', ' ', html)
-    text = unescape(text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text  # For complex HTML, consider BeautifulSoup as an enhancement. [web:711]
+    if not html:
+        return ''
+    # single Lexbor parse (C) instead of regex tag stripping; entities are decoded by the parser
+    text = HTMLParser(html).text(separator=' ')
+    return _WS_RE.sub(' ', text).strip()
+
+# Body-text fallbacks for materials/care, in priority order (first listed wins when several match)
+MATERIAL_TOKENS = ['100% cotton','cotton','leather','stainless steel','handmade','wool','linen','silk','polyester']
+CARE_TOKENS = ['machine washable','hand wash','dry clean','wash cold','do not bleach']
+
+def _build_automaton(groups: Dict[str, List[str]]):
+    """One automaton for every token list; each hit carries (field, rank, token)."""
+    ac = ahocorasick.Automaton()
+    for field, tokens in groups.items():
+        for rank, token in enumerate(tokens):
+            ac.add_word(token, (field, rank, token))
+    ac.make_automaton()
+    return ac
+
+_TOKEN_AC = _build_automaton({'materials': MATERIAL_TOKENS, 'care': CARE_TOKENS})
+
+def first_tokens(text: str, fields: Iterable[str]) -> Dict[str, str]:
+    """Highest-priority token per wanted field, via one linear Aho-Corasick scan for all of them."""
+    best: Dict[str, Tuple[int, str]] = {}
+    wanted = set(fields)
+    for _, (field, rank, token) in _TOKEN_AC.iter(text):
+        if field not in wanted:
+            continue
+        if field not in best or rank < best[field][0]:
+            best[field] = (rank, token)
+            if rank == 0:
+                wanted.discard(field)  # nothing can beat rank 0
+                if not wanted:
+                    break
+    return {field: hit[1] for field, hit in best.items()}
 
 def parse_variant_label(label: str) -> Tuple[str, str]:
     """Extract color and size from a variant label like 'Blue / Medium'."""
@@ -36,18 +76,21 @@ def safe_list(x):
 def safe_str(x):
     return '' if x is None else str(x)
 
-def build_price_summary(prices: List[float]) -> Tuple[str, str, str]:
-    if not prices:
+def build_price_summary(prices: np.ndarray) -> Tuple[str, str, str]:
+    if not prices.size:
         return '', '', ''
-    lo = min(prices)
-    hi = max(prices)
+    lo = float(prices.min())
+    hi = float(prices.max())
     best = f"{lo:.2f}"
     maxp = f"{hi:.2f}"
     prange = best if abs(hi - lo) < 1e-6 else f"{best}–{maxp}"
     return best, maxp, prange  # min, max, range
 
-def extract_metafields(p: Dict[str, Any]) -> Dict[str, str]:
-    """Pull common metafields if present in the source JSON."""
+def extract_metafields(p: Dict[str, Any], body_text: Optional[str] = None) -> Dict[str, str]:
+    """Pull common metafields if present in the source JSON.
+
+    body_text is the already-cleaned body_html, when the caller has it, to avoid parsing it again.
+    """
     fields = {'materials': '', 'care': '', 'warranty': '', 'shipping_info': '', 'size_chart_url': ''}
     # Accept several shapes: p['metafields'] as array of {namespace,key,value}, or p['metafields'] as dict, or custom keys.
     mf = p.get('metafields')
@@ -86,22 +129,17 @@ def extract_metafields(p: Dict[str, Any]) -> Dict[str, str]:
                 fields['size_chart_url'] = val
 
     # Fallback: mine body_html if metafields absent
-    body_text_low = html_to_text(p.get('body_html','')).lower()
-    if not fields['materials']:
-        for token in ['100% cotton','cotton','leather','stainless steel','handmade','wool','linen','silk','polyester']:
-            if token in body_text_low:
-                fields['materials'] = token
-                break
-    if not fields['care']:
-        for token in ['machine washable','hand wash','dry clean','wash cold','do not bleach']:
-            if token in body_text_low:
-                fields['care'] = token
-                break
+    if fields['materials'] and fields['care']:
+        return fields
+    if body_text is None:
+        body_text = html_to_text(p.get('body_html',''))
+    missing = [k for k in ('materials', 'care') if not fields[k]]
+    fields.update(first_tokens(body_text.lower(), missing))
     return fields  # Metafields carry store-specific details like materials/care/warranty/shipping. [web:690][web:717]
 
 def product_to_doc(p: Dict[str, Any]) -> Dict[str, Any]:
     title = (p.get('title') or '').strip()
-    handle = p.get('handle') or re.sub(r'[^a-z0-9-]+', '-', title.lower())
+    handle = p.get('handle') or _HANDLE_RE.sub('-', title.lower())
     url = f"{PRODUCT_BASE_URL}{handle}"
 
     vendor = p.get('vendor','')
@@ -140,7 +178,9 @@ def product_to_doc(p: Dict[str, Any]) -> Dict[str, Any]:
     variants_in = safe_list(p.get('variants'))
     variant_lines = []
     variant_struct = []
-    price_list = []
+    # scratch buffer sized to the variant count: no per-variant list growth, vectorized min/max
+    prices = np.empty(len(variants_in), dtype=np.float64)
+    n_prices = 0
     for v in variants_in:
         label = v.get('title') or ''
         color, size = parse_variant_label(label)
@@ -167,7 +207,8 @@ def product_to_doc(p: Dict[str, Any]) -> Dict[str, Any]:
 
         try:
             if price:
-                price_list.append(float(str(price)))
+                prices[n_prices] = float(price)
+                n_prices += 1
         except Exception:
             pass
 
@@ -197,10 +238,10 @@ def product_to_doc(p: Dict[str, Any]) -> Dict[str, Any]:
             'image_src': image_src
         })
 
-    best_price, max_price, price_range = build_price_summary(price_list)
+    best_price, max_price, price_range = build_price_summary(prices[:n_prices])
 
     # Metafields and policy-like info
-    mf = extract_metafields(p)
+    mf = extract_metafields(p, body)
     materials = mf['materials']
     care = mf['care']
     warranty = mf['warranty']
@@ -272,15 +313,41 @@ def product_to_doc(p: Dict[str, Any]) -> Dict[str, Any]:
         }
     }  # Includes core fields, variants, images, and metafields for richer Q&A. [web:687][web:690][web:676]
 
+def iter_products(f) -> Iterator[Dict[str, Any]]:
+    """Stream products one at a time from either {"products": [...]} or a bare [...] file opened in 'rb'."""
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    f.seek(0)
+    return ijson.items(f, 'item' if first == b'[' else 'products.item', use_float=True)
+
+def write_docs(docs: Iterable[Dict[str, Any]], path: str) -> int:
+    """Write docs as a JSON array incrementally so the full list is never held in memory.
+    One compact orjson doc per line: no indent padding, UTF-8 kept as-is."""
+    n = 0
+    with open(path, 'wb') as f:
+        f.write(b'[')
+        for doc in docs:
+            f.write(b',\n' if n else b'\n')
+            f.write(orjson.dumps(doc))
+            n += 1
+        f.write(b'\n]' if n else b']')
+    return n
+
 def main():
     if not os.path.exists(SRC):
         raise FileNotFoundError(f"Missing source file: {SRC}")
     os.makedirs(os.path.dirname(OUT), exist_ok=True)
-    src = json.load(open(SRC, 'r', encoding='utf-8'))
-    products = src.get('products', []) if isinstance(src, dict) else src
-    docs = [product_to_doc(p) for p in products]
-    json.dump(docs, open(OUT, 'w', encoding='utf-8'), ensure_ascii=False, indent=2)
-    print(f"Wrote {len(docs)} docs to {OUT}")
+    with open(SRC, 'rb') as f:
+        products = iter_products(f)
+        head = list(islice(products, POOL_MIN_PRODUCTS))
+        if len(head) < POOL_MIN_PRODUCTS:  # pool start-up outweighs the work on small catalogues
+            n = write_docs(map(product_to_doc, head), OUT)
+        else:
+            # products are independent: convert them across all cores; imap keeps source order in the output
+            with Pool() as pool:
+                n = write_docs(pool.imap(product_to_doc, chain(head, products), chunksize=64), OUT)
+    print(f"Wrote {n} docs to {OUT}")
 
 if __name__ == '__main__':
     main()
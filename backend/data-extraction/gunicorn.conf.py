@@ -0,0 +1,19 @@
+"""gunicorn settings for search_server: one copy of index/model in the master, shared by forked workers.
+
+Run from data-extraction/:  gunicorn -c gunicorn.conf.py search_server:app
+"""
+import os
+
+bind = f"{os.environ.get('SEARCH_DAEMON_HOST', '127.0.0.1')}:{os.environ.get('SEARCH_DAEMON_PORT', 8765)}"
+workers = int(os.environ.get('SEARCH_WORKERS', 2))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+
+def when_ready(server):
+    # runs in the master before any worker is forked
+    import search_server
+    search_server.preload()
+
+def post_fork(server, worker):
+    import search_server
+    search_server.after_fork()
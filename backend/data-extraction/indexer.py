@@ -1,78 +1,359 @@
-import json, os, re
-import numpy as np, faiss
-from sentence_transformers import SentenceTransformer
+import hashlib, json, math, os, re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+import numpy as np, faiss, ijson, lmdb, orjson, torch
+from numba import njit
+from onnx_encoder import load_encoder
 from tqdm import tqdm
 import os
 CUR = os.path.dirname(os.path.abspath(__file__))          # .../data-extraction
 ROOT = os.path.normpath(os.path.join(CUR, '..'))          # .../ai-assistant
 DATA_FILE = os.path.join(ROOT,'data-extraction', 'data', 'scraped_data.json')
+INDEX_DIR = os.path.join(ROOT,'data-extraction', 'database')
+POOL_MIN_PAGES = 1000  # below this many pages, chunking runs in-process (no worker pool)
+MAX_TRAIN_ROWS = 65_536  # build()'s training sample (~100 MB at 384-d); also bounds IVF nlist below
+TRAIN_ROWS_PER_LIST = 50  # k-means points per IVF list (faiss warns below 39)
+EMB_CACHE = os.path.join(INDEX_DIR, 'emb_cache.lmdb')  # sha256(lowercased text) -> float32 row, per encoder
 print (f"Using data file: {DATA_FILE}")
+_WS_RE = re.compile(r'\s+')
+
+@njit(cache=True)
+def _chunk_offsets(cps, chunk_size, overlap):
+    """(start, end) windows over a code-point array, cutting after the last sentence end ('. ', '! ' or
+    '? ') past 70% of a window.
+
+    Offsets are trimmed of spaces and empty windows are dropped, so callers only slice.
+    """
+    n = cps.shape[0]
+    out = np.empty((16, 2), dtype=np.int64)
+    k = 0
+    start = 0
+    while start < n:
+        end = min(start + chunk_size, n)
+        if end < n:
+            limit = start + chunk_size * 0.7
+            j = end - 2
+            while j > limit:
+                c = cps[j]
+                if (c == 46 or c == 33 or c == 63) and cps[j + 1] == 32:  # '.', '!', '?' then ' '
+                    end = j + 1
+                    break
+                j -= 1
+        s, e = start, end
+        while s < e and cps[s] == 32:
+            s += 1
+        while e > s and cps[e - 1] == 32:
+            e -= 1
+        if e > s:
+            if k == out.shape[0]:
+                grown = np.empty((2 * k, 2), dtype=np.int64)
+                grown[:k] = out
+                out = grown
+            out[k, 0] = s
+            out[k, 1] = e
+            k += 1
+        if end >= n:
+            break
+        start = end - overlap
+    return out[:k]
+
+def chunk_text(text, chunk_size=800, overlap=100):
+    text = _WS_RE.sub(' ', text or '')
+    # boundary search and trimming run in the JIT-compiled kernel; UTF-32 code units line up with str indices
+    cps = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    bounds = _chunk_offsets(cps, chunk_size, overlap).tolist()
+    return [text[start:end] for start, end in bounds]  # sentence-aware splitting improves retrieval fidelity [web:521]
+
+def _chunk_one_page(page):
+    """Chunk dicts for one scraped page; module-level so worker processes can run it."""
+    full_text = f"{page.get('title','')}\n\n{page.get('content','')}"
+    return [{
+        'text': chunk,
+        'url': page.get('url',''),
+        'title': page.get('title',''),
+        'page_type': page.get('page_type','general'),
+        'chunk_index': i,
+        'product_info': page.get('product_info', {})
+    } for i, chunk in enumerate(chunk_text(full_text))]
+
+def _text_key(text):
+    """Bytes identifying a chunk's text for embedding reuse (dedup groups and cache keys alike); the
+    MiniLM encoder is uncased, so case-only differences embed the same."""
+    return text.lower().encode()
+
+def _dedup_rows(texts):
+    """(representative row ids, per-row index into them), grouping chunks whose lowercased text has the
+    same blake2b digest (boilerplate blurbs repeated across pages). Only exact repeats share a vector:
+    near-duplicates such as colour/size/price variants must stay distinguishable to retrieval."""
+    reps, src, seen = [], np.empty(len(texts), dtype=np.int64), {}
+    for i, text in enumerate(texts):
+        key = hashlib.blake2b(_text_key(text), digest_size=16).digest()
+        j = seen.get(key)
+        if j is None:
+            j = seen[key] = len(reps)
+            reps.append(i)
+        src[i] = j
+    return reps, src
+
+def _cache_write(env, write):
+    """Run write(txn) in one write transaction, doubling the map and retrying whenever it fills up
+    (the aborted transaction leaves nothing behind)."""
+    while True:
+        try:
+            with env.begin(write=True) as txn:
+                return write(txn)
+        except lmdb.MapFullError:
+            env.set_mapsize(env.info()['map_size'] * 2)
+
+def _prune(txn, keep):
+    stale = [k for k in txn.cursor().iternext(keys=True, values=False) if k not in keep]
+    for k in stale:
+        txn.delete(k)
+
+def _map_bounded(ex, fn, items, window, chunksize):
+    """ex.map over items in page order with at most two `window`-sized slices submitted at once
+    (Executor.map alone submits every item up front, draining a streaming source into memory)."""
+    it = iter(items)
+    batch = list(islice(it, window))
+    results = ex.map(fn, batch, chunksize=chunksize) if batch else None
+    while results is not None:
+        batch = list(islice(it, window))  # next slice is queued while this one's results are consumed
+        following = ex.map(fn, batch, chunksize=chunksize) if batch else None
+        yield from results
+        results = following
+
 class DataIndexer:
     def __init__(self, model_name='sentence-transformers/all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(model_name)
+        # batch indexing owns the machine: let FAISS (training/add) and torch (encode) use every core
+        faiss.omp_set_num_threads(os.cpu_count() or 1)
+        torch.set_num_threads(os.cpu_count() or 1)
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model_name = model_name
+        self.model = load_encoder(model_name, device=self.device)
+        # int8 ONNX, fp32 and fp16 rows differ slightly, so cache entries are per model and encoder
+        self._cache_prefix = f"{model_name}|{type(self.model).__name__}|{self.device}\0".encode()
+        self.batch_size = 256 if self.device == 'cuda' else 128
         self.chunks = []
         self.embeddings = None
         self.index = None
+        self.dim = self.n = 0  # kept for index_info.json; build() never holds all embeddings at once
 
     def chunk_text(self, text, chunk_size=800, overlap=100):
-        chunks = []
-        text = re.sub(r'\s+', ' ', text or '')
-        start = 0
-        while start < len(text):
-            end = min(start + chunk_size, len(text))
-            chunk = text[start:end]
-            if end < len(text):
-                last_period = chunk.rfind('. ')
-                if last_period > chunk_size * 0.7:
-                    end = start + last_period + 1
-                    chunk = text[start:end]
-            chunk = chunk.strip()
-            if chunk: chunks.append(chunk)
-            if end >= len(text): break
-            start = end - overlap
-        return chunks  # sentence-aware splitting improves retrieval fidelity [web:521]
+        return chunk_text(text, chunk_size, overlap)
 
     def process_scraped_data(self, data_file=DATA_FILE):
-        pages = json.load(open(data_file,'r',encoding='utf-8'))
-        if not isinstance(pages, list):
-            raise AssertionError("data/scraped_data.json must be a list")
         print("Processing data into chunks...")
-        for page in tqdm(pages):
-            full_text = f"{page.get('title','')}\n\n{page.get('content','')}"
-            for i, chunk in enumerate(self.chunk_text(full_text)):
-                self.chunks.append({
-                    'text': chunk,
-                    'url': page.get('url',''),
-                    'title': page.get('title',''),
-                    'page_type': page.get('page_type','general'),
-                    'chunk_index': i,
-                    'product_info': page.get('product_info', {})
-                })
-        print(f"Created {len(self.chunks)} chunks from {len(pages)} items")
+        with open(data_file, 'rb') as f:
+            first = f.read(1)
+            while first.isspace():
+                first = f.read(1)
+            if first != b'[':
+                raise AssertionError("data/scraped_data.json must be a list")
+            f.seek(0)
+            # pages are decoded one at a time while chunking runs, never as a whole-file list
+            pages = ijson.items(f, 'item', use_float=True)
+            head = list(islice(pages, POOL_MIN_PAGES))
+            n_pages = len(head)
+            if n_pages < POOL_MIN_PAGES:  # pool start-up and per-worker kernel loading outweigh the work on small inputs
+                self._collect_chunks(map(_chunk_one_page, head), n_pages, quiet=True)
+            else:
+                # pages are independent: spread chunking over all cores; map() keeps page order
+                def counted():
+                    nonlocal n_pages
+                    yield from head
+                    for page in pages:
+                        n_pages += 1
+                        yield page
+                workers = os.cpu_count() or 1
+                with ProcessPoolExecutor(workers) as ex:
+                    self._collect_chunks(_map_bounded(ex, _chunk_one_page, counted(), 64 * workers, 64), None, quiet=False)
+        print(f"Created {len(self.chunks)} chunks from {n_pages} items")
 
-    def create_embeddings(self):
-        print("Creating embeddings...")
+    def _collect_chunks(self, page_chunks, total, quiet):
+        for chunks in tqdm(page_chunks, total=total, disable=quiet, mininterval=0.5):
+            self.chunks.extend(chunks)
+
+    def _encode(self, texts, env, batch_size, touched):
+        """float32 [len(texts), dim] rows, in input order; cached rows are read, the rest encoded and cached."""
+        # incremental reindex: texts this encoder has embedded on an earlier run come from the cache
+        cached = [None] * len(texts)
+        if env:
+            # same normalization as _dedup_rows: a group whose first member changes case still hits
+            keys = [self._cache_prefix + hashlib.sha256(_text_key(t)).digest() for t in texts]
+            touched.update(keys)
+            with env.begin() as txn:
+                cached = [txn.get(k) for k in keys]
+        todo = [i for i, v in enumerate(cached) if v is None]
+        # smart batching: encode in token-length order so each mini-batch pads to near-equal lengths,
+        # then scatter rows back to input order. Lengths come from one batched call into the Rust
+        # tokenizer rather than a Python-level tokenize() per chunk.
+        lens = [len(ids) for ids in self.model.tokenizer([texts[i] for i in todo], add_special_tokens=False)['input_ids']] if todo else []
+        order = np.asarray(todo, dtype=np.int64)[np.argsort(lens, kind='stable')]
+        # each batch's rows go straight into one preallocated float32 matrix (FP16 GPU output is
+        # upcast on assignment, FAISS always gets FP32); no list/asarray copies
+        out = None
+        for i in range(0, len(order), batch_size):
+            rows = order[i:i + batch_size]
+            embs = self.model.encode([texts[j] for j in rows], batch_size=batch_size, normalize_embeddings=True,
+                                     convert_to_numpy=True, convert_to_tensor=False)
+            if out is None:
+                out = np.empty((len(texts), embs.shape[1]), dtype=np.float32)
+            out[rows] = embs
+        if len(todo) < len(texts):
+            if out is None:
+                dim = len(next(v for v in cached if v is not None)) // 4
+                out = np.empty((len(texts), dim), dtype=np.float32)
+            for i, v in enumerate(cached):
+                if v is not None:
+                    out[i] = np.frombuffer(v, dtype=np.float32)
+        if env and todo:
+            rows = [(keys[i], out[i].tobytes()) for i in todo]
+            _cache_write(env, lambda txn: txn.cursor().putmulti(rows))
+        return out
+
+    def _iter_embeddings(self, window, batch_size=None, dedup=True, cache_path=EMB_CACHE):
+        """Yield float32 [m, dim] blocks covering self.chunks in order, `window` chunks per block."""
+        batch_size = batch_size or self.batch_size
         texts = [c['text'] for c in self.chunks]
-        embs = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=True)
-        self.embeddings = np.asarray(embs, dtype='float32')
-        if self.embeddings.ndim != 2:
+        src = np.arange(len(texts))
+        if dedup:
+            # only one representative per group of repeated texts goes through the encoder
+            reps, src = _dedup_rows(texts)
+            print(f"Embedding {len(reps)} unique of {len(texts)} chunks")
+            texts = [texts[i] for i in reps]
+        # a representative always precedes its duplicates, so each window encodes a contiguous run of
+        # new representatives; a row is kept past its own window only until the window holding its last copy
+        last = np.full(len(texts), -1, dtype=np.int64)
+        np.maximum.at(last, src, np.arange(len(src)))
+        kept, done, touched = {}, 0, set()
+        env = lmdb.open(cache_path, map_size=1 << 30) if cache_path else None
+        try:
+            for w in tqdm(range(0, len(src), window)):
+                rows = src[w:w + window]
+                new = max(0, int(rows.max()) + 1 - done)  # windows of pure duplicates add nothing
+                embs = self._encode(texts[done:done + new], env, batch_size, touched) if new > 0 else None
+                if embs is not None and len(rows) == new:  # no duplicates in this window: block is ready
+                    block = embs
+                else:
+                    dim = embs.shape[1] if embs is not None else len(next(iter(kept.values())))
+                    block = np.empty((len(rows), dim), dtype=np.float32)
+                    fresh = rows >= done
+                    if embs is not None:
+                        block[fresh] = embs[rows[fresh] - done]  # duplicates copy their representative's row
+                    for i in np.flatnonzero(~fresh):
+                        block[i] = kept[rows[i]]
+                end = w + len(rows)
+                for j in np.unique(rows[rows < done]).tolist():  # older rows whose last copy was in this window
+                    if last[j] < end:
+                        del kept[j]
+                for j in range(done, done + new):
+                    if last[j] >= end:
+                        kept[j] = embs[j - done].copy()  # a view would pin its whole window in memory
+                done += new
+                yield block
+            if env and len(src):  # an empty corpus touches nothing and would wipe the whole cache
+                # after a complete pass, rows for texts (or encoders) no longer in the corpus are dead weight;
+                # dropping them frees their pages for reuse so the cache tracks the catalogue, not its history
+                _cache_write(env, lambda txn: _prune(txn, touched))
+        finally:
+            if env:
+                env.close()
+
+    def create_embeddings(self, batch_size=None, dedup=True, cache_path=EMB_CACHE):
+        """Full [n_chunks, dim] matrix in self.embeddings; build() streams instead and never holds it."""
+        print("Creating embeddings...")
+        # one window spanning every chunk: smart batching sorts the whole corpus by length
+        blocks = list(self._iter_embeddings(max(1, len(self.chunks)), batch_size, dedup, cache_path))
+        self.embeddings = blocks[0] if blocks else None
+        if self.embeddings is None or self.embeddings.ndim != 2:
             raise ValueError("Embeddings must be 2D [n_chunks, dim]")
+        self.n, self.dim = (int(x) for x in self.embeddings.shape)
+        # FAISS train/add take this buffer as-is only when it is C-contiguous float32; anything else is copied
+        assert self.embeddings.dtype == np.float32 and self.embeddings.flags['C_CONTIGUOUS']
+
+    def _new_index(self, n, dim, nprobe, ef_search):
+        if n < 2000:
+            # small corpora: IVF/PQ training and probing overhead outweighs an exact scan; SQ8 keeps the
+            # exhaustive scan but stores 1 B/dim instead of 4, quartering memory and scan bandwidth [web:291][web:286]
+            return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        if n < 100_000:
+            # mid-size: HNSW graph walk visits ~log N vectors with >0.95 recall; SQ8 vector storage
+            # cuts ~1.8 KB/vector (FP32 at 384-d + links) to ~0.6 KB with negligible recall loss
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.hnsw.efSearch = ef_search
+            return index
+        # IVF limits each query to ~nprobe/nlist of the corpus; PQ48x4fs packs 4-bit codes so the
+        # FastScan kernels do the distance-table lookups in SIMD registers (24 B/vector instead of dim*4)
+        # nlist is clamped so a MAX_TRAIN_ROWS sample still trains every list properly
+        nlist = min(max(32, int(4 * math.sqrt(n))), MAX_TRAIN_ROWS // TRAIN_ROWS_PER_LIST)
+        index = faiss.index_factory(dim, f"IVF{nlist},PQ{dim // 8}x4fs", faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = nprobe
+        return index
 
-    def build_faiss_index(self):
+    def build_faiss_index(self, nprobe=8, ef_search=64):
         print("Building FAISS index...")
-        dim = int(self.embeddings.shape[1])
-        self.index = faiss.IndexFlatIP(dim)  # cosine via inner product on normalized vectors [web:291][web:286]
+        self.n, self.dim = (int(x) for x in self.embeddings.shape)
+        self.index = self._new_index(self.n, self.dim, nprobe, ef_search)
+        self.index.train(self.embeddings)  # SQ: per-dimension ranges only, cheap; IVF: k-means + PQ codebooks
         self.index.add(self.embeddings)
         print(f"Built FAISS index with {self.index.ntotal} vectors")
 
-    def save_index(self, index_dir='data-extraction/database'):
+    def build(self, nprobe=8, ef_search=64, window=4096, batch_size=None, dedup=True, cache_path=EMB_CACHE):
+        """Embed and index window by window: each window of chunks is encoded, added to FAISS and dropped,
+        so peak memory is one window of vectors plus a training sample of at most MAX_TRAIN_ROWS rows.
+
+        When the sample is smaller than the corpus, a first pass collects it and a second pass adds every
+        row; with the embedding cache on, the second pass reads vectors instead of re-encoding them."""
+        print("Embedding and indexing...")
+        self.n, self.index, self.embeddings = len(self.chunks), None, None
+        if not self.n:
+            raise ValueError("No chunks to index")
+        blocks = self._iter_embeddings(window, batch_size, dedup, cache_path)
+        first = next(blocks)
+        self.dim = int(first.shape[1])
+        self.index = self._new_index(self.n, self.dim, nprobe, ef_search)
+        # IVF k-means wants TRAIN_ROWS_PER_LIST vectors per list; SQ only learns per-dimension ranges
+        per_list = TRAIN_ROWS_PER_LIST * self.index.nlist if hasattr(self.index, 'nlist') else 16_384
+        sample = np.empty((min(self.n, per_list, MAX_TRAIN_ROWS), self.dim), dtype=np.float32)
+        if len(sample) == self.n:
+            # the whole corpus is the training set: fill it in one pass, train, add
+            start = 0
+            for block in chain([first], blocks):
+                sample[start:start + len(block)] = block
+                start += len(block)
+            self.index.train(sample)
+            self.index.add(sample)
+        else:
+            # uniform rows from the whole corpus: chunks come in catalogue order, so leading rows would
+            # only cover the first categories and leave the other centroids poorly placed
+            picks = np.sort(np.random.default_rng(0).choice(self.n, len(sample), replace=False))
+            start = 0
+            for block in chain([first], blocks):
+                lo, hi = np.searchsorted(picks, (start, start + len(block)))
+                sample[lo:hi] = block[picks[lo:hi] - start]
+                start += len(block)
+            self.index.train(sample)
+            sample = None
+            for block in self._iter_embeddings(window, batch_size, dedup, cache_path):
+                self.index.add(block)
+        print(f"Built FAISS index with {self.index.ntotal} vectors")
+
+    def save_index(self, index_dir=INDEX_DIR):
         os.makedirs(index_dir, exist_ok=True)
         faiss.write_index(self.index, os.path.join(index_dir, 'faiss.index'))
-        json.dump(self.chunks, open(os.path.join(index_dir,'chunks_metadata.json'),'w',encoding='utf-8'), ensure_ascii=False, indent=2)
+        # row-addressable copy for search.py: key = FAISS row id (big-endian, so keys sort in row order)
+        env = lmdb.open(os.path.join(index_dir, 'chunks.lmdb'), map_size=2 << 30)
+        with env.begin(write=True) as txn:
+            txn.drop(env.open_db(txn=txn), delete=False)
+            txn.cursor().putmulti(((i.to_bytes(8, 'big'), orjson.dumps(c, option=orjson.OPT_NON_STR_KEYS))
+                                   for i, c in enumerate(self.chunks)), append=True)
+        env.close()
         info = {
-            'dimension': int(self.embeddings.shape[1]),
-            'num_vectors': int(self.embeddings.shape[0]),
-            'model_name': 'sentence-transformers/all-MiniLM-L6-v2'
+            'dimension': self.dim,
+            'num_vectors': self.n,
+            'model_name': self.model_name,
+            'encoder': type(self.model).__name__  # OnnxEncoder (int8) or SentenceTransformer (fp32)
         }
         json.dump(info, open(os.path.join(index_dir,'index_info.json'),'w'), indent=2)
         print(f"Saved index and metadata to {index_dir}/")
@@ -95,13 +376,12 @@ class DataIndexer:
 
 if __name__ == '__main__':
     # If you prefer auto-conversion, run the converter first
-    if not os.path.exists('data-extraction/data/scraped_data.json'):
+    if not os.path.exists(DATA_FILE):
         raise SystemExit("Run convert_shopify_to_scraped.py first to produce data/scraped_data.json")
 
     idx = DataIndexer()
     idx.process_scraped_data()
-    idx.create_embeddings()
-    idx.build_faiss_index()
+    idx.build()
     idx.save_index()
     # smoke test
     res = idx.search("what is price of blue t shirt?", top_k=3)
@@ -0,0 +1,73 @@
+"""Int8-quantized MiniLM on ONNX Runtime, used in place of SentenceTransformer for encoding.
+
+Export once with:  python onnx_encoder.py
+load_encoder() picks the quantized model when it has been exported and falls back to PyTorch otherwise.
+"""
+import os, sys
+import numpy as np
+
+CUR = os.path.dirname(os.path.abspath(__file__))   # .../data-extraction
+ONNX_DIR = os.path.join(CUR, 'database', 'onnx')
+ONNX_FILE = 'model_quantized.onnx'
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+def export_quantized(model_name=MODEL_NAME, save_dir=ONNX_DIR):
+    """Export to ONNX, then dynamically quantize the weights to int8 (int8 GEMM / VNNI kernels on CPU)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+    ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(save_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(save_dir)
+    out = os.path.join(save_dir, ONNX_FILE)
+    quantize_dynamic(os.path.join(save_dir, 'model.onnx'), out, weight_type=QuantType.QInt8)
+    return out
+
+class OnnxEncoder:
+    """Tokenize -> ORT session -> mean-pool -> L2-normalize; mirrors SentenceTransformer.encode."""
+
+    def __init__(self, model_dir=ONNX_DIR, max_seq_length=256, num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL  # fuse attention/GELU/LayerNorm
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(os.path.join(model_dir, ONNX_FILE), sess_options=opts,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False, **kwargs):
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors='np')
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]  # last_hidden_state [batch, seq, dim]
+            mask = enc['attention_mask'][..., None].astype(np.float32)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out.append(emb.astype(np.float32, copy=False))
+        return np.concatenate(out) if out else np.empty((0, 0), dtype=np.float32)
+
+def has_quantized_model(model_name=MODEL_NAME):
+    return model_name == MODEL_NAME and os.path.exists(os.path.join(ONNX_DIR, ONNX_FILE))
+
+def load_encoder(model_name=MODEL_NAME, device='cpu', num_threads=None):
+    # stderr: search.py's stdout carries the JSON results
+    if device == 'cpu' and has_quantized_model(model_name):
+        print(f"Encoder: int8 ONNX ({os.path.join(ONNX_DIR, ONNX_FILE)})", file=sys.stderr)
+        return OnnxEncoder(num_threads=num_threads)
+    from sentence_transformers import SentenceTransformer
+    if device == 'cuda':
+        # ORT int8 kernels are CPU-only; on GPU use the PyTorch model in FP16 (tensor cores)
+        print(f"Encoder: PyTorch fp16 on cuda ({model_name})", file=sys.stderr)
+        return SentenceTransformer(model_name, device='cuda').half()
+    print(f"Encoder: PyTorch fp32 on {device} ({model_name}); run onnx_encoder.py for the int8 model",
+          file=sys.stderr)
+    return SentenceTransformer(model_name, device=device)
+
+if __name__ == '__main__':
+    print(f"Wrote {export_quantized()}")
@@ -1,52 +1,196 @@
-import sys, json, os
-import numpy as np, faiss
-from sentence_transformers import SentenceTransformer
+import sys, os, threading
+os.environ.setdefault('OMP_WAIT_POLICY', 'PASSIVE')  # must be set before faiss/torch load OpenMP; idle threads sleep
+from collections import OrderedDict
+import urllib.error, urllib.request
+import numpy as np, orjson
 
 CUR = os.path.dirname(os.path.abspath(__file__))   # .../data-extraction
 INDEX_DIR = os.path.join(CUR, 'database')
 INDEX_PATH = os.path.normpath(os.path.join(INDEX_DIR, 'faiss.index'))
-META_PATH  = os.path.normpath(os.path.join(INDEX_DIR, 'chunks_metadata.json'))
+META_PATH  = os.path.normpath(os.path.join(INDEX_DIR, 'chunks_metadata.json'))  # legacy row-wise dump
+CHUNKS_DB_PATH = os.path.normpath(os.path.join(INDEX_DIR, 'chunks.lmdb'))
 MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+DAEMON_URL = os.environ.get('SEARCH_DAEMON_URL', 'http://127.0.0.1:8765')
+# set by callers that already tried the daemon (server.js's fallback) so the CLI goes straight to in-process search
+NO_DAEMON = os.environ.get('SEARCH_NO_DAEMON') == '1'
+
+class LmdbChunks:
+    """Read-only, list-like view of chunks.lmdb; only the rows looked up are decoded."""
+
+    def __init__(self, path=CHUNKS_DB_PATH):
+        self.path = path
+        self.env = self.pid = None
+        env = self._open()  # row count only; readers open their own handle (see _env)
+        self.size = env.stat()['entries']
+        env.close()
+
+    def _open(self):
+        import lmdb
+        return lmdb.open(self.path, readonly=True, lock=False, readahead=False)
+
+    def _env(self):
+        if self.pid != os.getpid():  # first read in this process, e.g. a worker forked from a preloaded master
+            self.reopen()
+        return self.env
+
+    def reopen(self):
+        """Open a handle owned by the current process; LMDB handles must not be used across fork()."""
+        self.env = None  # drop any handle inherited from the parent before opening our own
+        self.env = self._open()
+        self.pid = os.getpid()
+        self.size = self.env.stat()['entries']
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        with self._env().begin(buffers=True) as txn:
+            raw = txn.get(int(idx).to_bytes(8, 'big'))
+            if raw is None:
+                raise IndexError(idx)
+            return orjson.loads(raw)
 
 def load_index_and_meta():
+    import faiss  # deferred so the daemon client path never pays for it
+    # single top-k queries: a few threads beat a full-width fork/join, and co-running searches don't oversubscribe
+    faiss.omp_set_num_threads(min(4, os.cpu_count() or 1))
     if not os.path.exists(INDEX_PATH):
         raise FileNotFoundError(f"Missing index file: {INDEX_PATH}")
-    if not os.path.exists(META_PATH):
-        raise FileNotFoundError(f"Missing metadata file: {META_PATH}")
-    index = faiss.read_index(INDEX_PATH)
-    meta = json.load(open(META_PATH,'r',encoding='utf-8'))
+    if not any(os.path.exists(p) for p in (CHUNKS_DB_PATH, META_PATH)):
+        raise FileNotFoundError(f"Missing metadata file: {CHUNKS_DB_PATH}")
+    # map inverted lists instead of copying them onto the heap; pages are shared via the OS page cache
+    index = faiss.read_index(INDEX_PATH, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if hasattr(index, 'nprobe'):  # IVF indexes: number of inverted lists scanned per query
+        index.nprobe = int(os.environ.get('FAISS_NPROBE', 8))
+    if hasattr(index, 'hnsw'):  # HNSW indexes: candidate list size during the graph walk
+        index.hnsw.efSearch = int(os.environ.get('FAISS_EF_SEARCH', 64))
+    if os.path.exists(CHUNKS_DB_PATH):
+        return index, LmdbChunks()
+    # indexes saved before chunks.lmdb existed: parse the whole JSON file
+    with open(META_PATH,'rb') as f:
+        meta = orjson.loads(f.read())
     return index, meta
 
-def embed_query(model, text):
-    vec = model.encode([text], normalize_embeddings=True)
-    return np.asarray(vec, dtype='float32')
+# Loaded lazily and kept for the life of the process (reused across queries by search_server.py)
+_MODEL = None
+_INDEX_AND_META = None
+
+def get_model():
+    global _MODEL
+    if _MODEL is None:
+        from onnx_encoder import load_encoder
+        # int8 ONNX session when exported; single-sentence inference needs few threads (same cap as FAISS)
+        _MODEL = load_encoder(MODEL_NAME, num_threads=min(4, os.cpu_count() or 1))
+    return _MODEL
+
+def get_index_and_meta():
+    global _INDEX_AND_META
+    if _INDEX_AND_META is None:
+        _INDEX_AND_META = load_index_and_meta()
+    return _INDEX_AND_META
+
+def normalize_query(text):
+    # MiniLM's tokenizer is uncased and whitespace-insensitive, so the normalized text embeds identically
+    return ' '.join(text.lower().split())
+
+class EmbeddingCache:
+    """LRU of normalized query -> embedding, usable from batched and single-query paths.
+
+    Rows are kept as immutable float32 bytes so no caller can mutate a cached vector in place.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            raw = self.data.get(key)
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.data.move_to_end(key)
+        return np.frombuffer(raw, dtype=np.float32)
+
+    def put(self, key, vec):
+        with self.lock:
+            self.data[key] = np.ascontiguousarray(vec, dtype=np.float32).tobytes()
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+_EMB_CACHE = EmbeddingCache()
+
+def cache_stats():
+    return _EMB_CACHE.stats()
+
+def embed_queries(texts):
+    """[len(texts), dim] embeddings for already-normalized queries; cache misses are encoded in one batch."""
+    rows = [_EMB_CACHE.get(t) for t in texts]
+    missing = list(dict.fromkeys(t for t, r in zip(texts, rows) if r is None))
+    if missing:
+        vecs = get_model().encode(missing, normalize_embeddings=True, convert_to_numpy=True, convert_to_tensor=False)
+        assert vecs.dtype == np.float32 and vecs.flags['C_CONTIGUOUS'], "encoder must return C-contiguous float32"
+        fresh = dict(zip(missing, vecs))
+        for t, v in fresh.items():
+            _EMB_CACHE.put(t, v)
+        rows = [fresh[t] if r is None else r for t, r in zip(texts, rows)]
+    return np.stack(rows)
+
+def hits_to_results(meta, D, I):
+    out = []
+    for idx, score in zip(I[0].tolist(), D[0].tolist()):
+        if idx == -1 or idx >= len(meta): continue
+        m = meta[idx]
+        out.append({
+            'text': m.get('text',''),
+            'url': m.get('url',''),
+            'title': m.get('title',''),
+            'page_type': m.get('page_type',''),
+            'score': float(score),
+            'product_info': m.get('product_info', {})
+        })
+    return out
+
+def search_batch(queries, top_k=5):
+    """One encode call and one index.search for several queries; a result list per query."""
+    index, meta = get_index_and_meta()
+    qv = embed_queries([normalize_query(q) for q in queries])
+    D, I = index.search(qv, int(top_k))
+    return [hits_to_results(meta, D[i:i + 1], I[i:i + 1]) for i in range(len(queries))]
 
 def search_knowledge_base(query, top_k=5):
     try:
-        index, meta = load_index_and_meta()
-        model = SentenceTransformer(MODEL_NAME)
-        qv = embed_query(model, query)
-        D, I = index.search(qv, int(top_k))
-        out = []
-        for idx, score in zip(I[0].tolist(), D[0].tolist()):
-            if idx == -1 or idx >= len(meta): continue
-            m = meta[idx]
-            out.append({
-                'text': m.get('text',''),
-                'url': m.get('url',''),
-                'title': m.get('title',''),
-                'page_type': m.get('page_type',''),
-                'score': float(score),
-                'product_info': m.get('product_info', {})
-            })
-        return out
+        return search_batch([query], top_k)[0]
     except Exception as e:
         return {'error': str(e)}
 
+def search_via_daemon(query, top_k=5, timeout=10):
+    """Ask a running search_server.py; returns None when no daemon is reachable or its search failed."""
+    body = orjson.dumps({'query': query, 'top_k': int(top_k)})
+    req = urllib.request.Request(f"{DAEMON_URL}/search", data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            results = orjson.loads(resp.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    return None if isinstance(results, dict) and 'error' in results else results
+
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print(json.dumps({'error': 'Query required'})); sys.exit(1)
+        sys.stdout.buffer.write(orjson.dumps({'error': 'Query required'}) + b'\n'); sys.exit(1)
     query = sys.argv[1]
     top_k = int(sys.argv[2]) if len(sys.argv) > 2 else 5
-    results = search_knowledge_base(query, top_k)
-    print(json.dumps(results, ensure_ascii=False))
+    results = None if NO_DAEMON else search_via_daemon(query, top_k)
+    if results is None:  # no daemon (or it failed): load model and index in-process
+        results = search_knowledge_base(query, top_k)
+    sys.stdout.buffer.write(orjson.dumps(results) + b'\n')
@@ -0,0 +1,90 @@
+"""Long-lived search daemon: loads the encoder, FAISS index and metadata once per process.
+
+Run from data-extraction/:  python search_server.py   (or: uvicorn search_server:app --port 8765)
+Multi-worker:               gunicorn -c gunicorn.conf.py search_server:app
+search.py's CLI forwards queries here when the daemon is up and falls back to in-process search otherwise.
+"""
+import os
+import asyncio
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from onnx_encoder import has_quantized_model
+from search import MODEL_NAME, LmdbChunks, cache_stats, get_model, get_index_and_meta, search_batch
+
+HOST = os.environ.get('SEARCH_DAEMON_HOST', '127.0.0.1')
+PORT = int(os.environ.get('SEARCH_DAEMON_PORT', 8765))
+
+class SearchRequest(BaseModel):
+    query: str
+    # batches search at their largest k, so one oversized (or invalid) k must not reach search_batch
+    top_k: int = Field(5, ge=1, le=50)
+
+class _Batcher:
+    """Coalesces requests that arrive while a batch is running into the next search_batch call."""
+
+    def __init__(self):
+        self.pending = []  # (query, top_k, future)
+        self.lock = asyncio.Lock()
+
+    async def submit(self, query, top_k):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.pending.append((query, top_k, fut))
+        if len(self.pending) == 1:
+            loop.create_task(self._flush())
+        return await fut
+
+    async def _flush(self):
+        async with self.lock:  # one encode + index.search in flight; newcomers queue for the next batch
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                # one search at the largest k; ranked lists are then cut to each request's own k
+                results = await asyncio.get_running_loop().run_in_executor(
+                    None, search_batch, [q for q, _, _ in batch], max(k for _, k, _ in batch))
+                results = [res[:k] for (_, k, _), res in zip(batch, results)]
+            except Exception as e:
+                results = [{'error': str(e)}] * len(batch)
+            for (_, _, fut), res in zip(batch, results):
+                if not fut.done():  # client may have gone away
+                    fut.set_result(res)
+
+_BATCHER = _Batcher()
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+def preload():
+    """Load shared state in the gunicorn master so forked workers share its pages copy-on-write."""
+    get_index_and_meta()  # mmap'd index pages and heap structures are shared by all workers; no LMDB handle stays open
+    if not has_quantized_model(MODEL_NAME):
+        # PyTorch model on CPU (search never touches CUDA, whose contexts cannot cross fork());
+        # ORT sessions start thread pools that do not survive fork(), so those load per worker
+        model = get_model()
+        model.eval()
+        model.share_memory()
+
+def after_fork():
+    """Open this worker's own chunks.lmdb handle up front rather than on its first query."""
+    _, meta = get_index_and_meta()
+    if isinstance(meta, LmdbChunks):
+        meta.reopen()
+
+@app.on_event('startup')
+def _warm():
+    get_index_and_meta()
+    get_model()
+
+@app.get('/stats')
+def stats():
+    return {'embedding_cache': cache_stats()}
+
+@app.post('/search')
+async def search(req: SearchRequest):
+    # model, index, metadata and query embeddings are all cached at module level in search.py
+    return await _BATCHER.submit(req.query, req.top_k)
+
+if __name__ == '__main__':
+    uvicorn.run(app, host=HOST, port=PORT)
@@ -3,6 +3,7 @@ const cors = require('cors');
 const helmet = require('helmet');
 const rateLimit = require('express-rate-limit');
 const { spawn } = require('child_process');
+const http = require('http');
 const path = require('path');
 const fs = require('fs');
 
@@ -92,8 +93,51 @@ function handlePersonalizedQuery(message) {
     return "I notice you're asking about your personal information. To help you better, please provide relevant details like your order number or reference number. Alternatively, you can check your account dashboard for this information.";
 }
 
+// Long-lived Python search daemon (data-extraction/search_server.py): model and index stay loaded
+const SEARCH_DAEMON_URL = process.env.SEARCH_DAEMON_URL || 'http://127.0.0.1:8765';
+
+// Resolves null when the daemon is not reachable so the caller can fall back to the CLI
+function searchViaDaemon(query, topK) {
+    return new Promise((resolve) => {
+        const body = JSON.stringify({ query, top_k: topK });
+        const req = http.request(`${SEARCH_DAEMON_URL}/search`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+            timeout: 10000
+        }, (res) => {
+            const chunks = [];
+            res.on('data', (chunk) => {
+                chunks.push(chunk);
+            });
+            res.on('end', () => {
+                if (res.statusCode !== 200) return resolve(null);
+                try {
+                    // decode once so multi-byte UTF-8 characters split across chunks stay intact
+                    const results = JSON.parse(Buffer.concat(chunks).toString('utf8'));
+                    // a failed batch comes back as {error}: let the script path retry it
+                    resolve(results && results.error ? null : results);
+                } catch (error) {
+                    resolve(null);
+                }
+            });
+        });
+        req.on('timeout', () => req.destroy());
+        req.on('error', () => resolve(null));
+        req.end(body);
+    });
+}
+
+// Search function: daemon first, one-off Python process otherwise
+async function searchKnowledgeBase(query, topK = 5) {
+    const daemonResults = await searchViaDaemon(query, topK);
+    if (daemonResults !== null) {
+        return daemonResults;
+    }
+    return searchViaScript(query, topK);
+}
+
 // Search function using Python script
-function searchKnowledgeBase(query, topK = 5) {
+function searchViaScript(query, topK = 5) {
     const projectRoot = path.join(__dirname, '..'); // ai-assistant root
     
     return new Promise((resolve, reject) => {
@@ -101,7 +145,9 @@ function searchKnowledgeBase(query, topK = 5) {
         const python = process.env.PYTHON_PATH || 'python';
         
         const proc = spawn(python, [pythonScript, query, topK.toString()], {
-            stdio: ['pipe', 'pipe', 'pipe']
+            stdio: ['pipe', 'pipe', 'pipe'],
+            // the daemon was already tried (and failed or timed out): don't let search.py ask it again
+            env: { ...process.env, SEARCH_NO_DAEMON: '1' }
         });
         
         let output = '';